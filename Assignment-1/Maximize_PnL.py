@@ -1,12 +1,36 @@
 import pandas as pd
 import numpy as np
-import math
 from enum import Enum
 from datetime import datetime
+from scipy.signal import lfilter
+
+try:
+    from numba import njit, prange
+except ImportError:  # without Numba the kernels run as plain Python over the arrays
+    prange = range
+
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+try:
+    import talib
+except ImportError:  # TA-Lib is optional; the pandas versions below are used instead
+    talib = None
 
 # --- 1. Load and clean data ---
 file_path = "EUR_USD.csv"  # Make sure this path is correct
-df = pd.read_csv(file_path, dayfirst=True)  # Parse dates correctly
+price_cols = ["Price", "Open", "High", "Low"]
+df = pd.read_csv(
+    file_path,
+    usecols=["Date", *price_cols],
+    dtype=dict.fromkeys(price_cols, np.float64),
+    parse_dates=["Date"],
+    dayfirst=True,  # Parse dates correctly
+    engine="c",
+)
 
 # Standardize column names
 df.columns = [col.strip().lower() for col in df.columns]
@@ -15,15 +39,10 @@ df.columns = [col.strip().lower() for col in df.columns]
 if "price" in df.columns:
     df.rename(columns={"price": "close"}, inplace=True)
 
-# Ensure numeric columns
 numeric_cols = ["close", "high", "low", "open"]
 for col in numeric_cols:
     if col not in df.columns:
         raise ValueError(f"Missing required column: {col}")
-    df[col] = pd.to_numeric(df[col], errors="coerce")
-
-# Convert date column to datetime
-df["date"] = pd.to_datetime(df["date"], dayfirst=True)
 
 # Drop rows with missing price data
 df.dropna(subset=numeric_cols, inplace=True)
@@ -37,63 +56,143 @@ print(df.head())
 
 
 # --- 2. Indicator Functions ---
-def calculate_atr(high, low, close, period=14):
-    high_low = high - low
-    high_close = np.abs(high - close.shift())
-    low_close = np.abs(low - close.shift())
-    tr = pd.concat([high_low, high_close, low_close], axis=1).max(axis=1)
-    return tr.ewm(alpha=1 / period, adjust=False).mean()
+def _ewm(x, alpha):
+    """
+    ewm(alpha=alpha, adjust=False).mean() of an ndarray, as an IIR filter.
+    Like pandas, leading NaNs stay NaN and the filter starts at the first valid
+    value; ``x`` must be NaN-free after that.
+    """
+    y = np.full_like(x, np.nan)
+    valid = np.flatnonzero(~np.isnan(x))
+    if valid.size:
+        s = valid[0]
+        zi = [(1.0 - alpha) * x[s]]
+        y[s:], _ = lfilter([alpha], [1.0, alpha - 1.0], x[s:], zi=zi)
+    return y
+
+
+def _indicator_cache(high, low, close):
+    """Shared ATR/ADX inputs as ndarrays: (tr, prev_close, high_diff, low_diff)."""
+    h = high.to_numpy(dtype=np.float64)
+    l = low.to_numpy(dtype=np.float64)
+    c = close.to_numpy(dtype=np.float64)
+    prev_close = np.empty_like(c)
+    high_diff = np.empty_like(h)
+    low_diff = np.empty_like(l)
+    prev_close[:1] = high_diff[:1] = low_diff[:1] = np.nan
+    prev_close[1:] = c[:-1]
+    np.subtract(h[1:], h[:-1], out=high_diff[1:])
+    np.subtract(l[1:], l[:-1], out=low_diff[1:])
+
+    # NaN-skipping max, like the DataFrame max(axis=1) it replaces
+    tr = np.fmax.reduce([h - l, np.abs(h - prev_close), np.abs(l - prev_close)])
+    return tr, prev_close, high_diff, low_diff
+
+
+def calculate_atr(high, low, close, period=14, cache=None):
+    if talib is not None:
+        atr = talib.ATR(
+            high.to_numpy(dtype=np.float64),
+            low.to_numpy(dtype=np.float64),
+            close.to_numpy(dtype=np.float64),
+            timeperiod=period,
+        )
+        return pd.Series(atr, index=close.index)
+    if cache is None:
+        cache = _indicator_cache(high, low, close)
+    return pd.Series(_ewm(cache[0], 1 / period), index=close.index)
 
 
 def calculate_rsi(close, period=14):
-    delta = close.diff()
-    gain = (delta.where(delta > 0, 0)).ewm(alpha=1 / period, adjust=False).mean()
-    loss = (-delta.where(delta < 0, 0)).ewm(alpha=1 / period, adjust=False).mean()
-    rs = gain / loss
-    return 100 - (100 / (1 + rs))
+    if talib is not None:
+        rsi = talib.RSI(close.to_numpy(dtype=np.float64), timeperiod=period)
+        return pd.Series(rsi, index=close.index)
+    delta = close.diff().to_numpy(dtype=np.float64)
+    gain = _ewm(np.where(delta > 0, delta, 0.0), 1 / period)
+    loss = _ewm(np.where(delta < 0, -delta, 0.0), 1 / period)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = gain / loss
+    return pd.Series(100 - (100 / (1 + rs)), index=close.index)
 
 
 def calculate_macd(close, fast=12, slow=26, signal=9):
-    ema_fast = close.ewm(span=fast, adjust=False).mean()
-    ema_slow = close.ewm(span=slow, adjust=False).mean()
+    if talib is not None:
+        macd_line, signal_line, _ = talib.MACD(
+            close.to_numpy(dtype=np.float64),
+            fastperiod=fast,
+            slowperiod=slow,
+            signalperiod=signal,
+        )
+        return (
+            pd.Series(macd_line, index=close.index),
+            pd.Series(signal_line, index=close.index),
+        )
+    c = close.to_numpy(dtype=np.float64)
+    # ewm(span=s) is ewm(alpha=2 / (s + 1))
+    ema_fast = _ewm(c, 2 / (fast + 1))
+    ema_slow = _ewm(c, 2 / (slow + 1))
     macd_line = ema_fast - ema_slow
-    signal_line = macd_line.ewm(span=signal, adjust=False).mean()
-    return macd_line, signal_line
+    signal_line = _ewm(macd_line, 2 / (signal + 1))
+    return (
+        pd.Series(macd_line, index=close.index),
+        pd.Series(signal_line, index=close.index),
+    )
 
 
 def calculate_stoch(high, low, close, k=9, d=3, smooth_k=9):
+    if talib is not None:
+        percent_k, percent_d = talib.STOCH(
+            high.to_numpy(dtype=np.float64),
+            low.to_numpy(dtype=np.float64),
+            close.to_numpy(dtype=np.float64),
+            fastk_period=k,
+            slowk_period=smooth_k,
+            slowd_period=d,
+        )
+        return (
+            pd.Series(percent_k, index=close.index),
+            pd.Series(percent_d, index=close.index),
+        )
     lowest_low = low.rolling(window=k).min()
     highest_high = high.rolling(window=k).max()
-    percent_k = 100 * ((close - lowest_low) / (highest_high - lowest_low))
-    percent_k = percent_k.rolling(window=smooth_k).mean()
+    num = (close - lowest_low).to_numpy()
+    den = (highest_high - lowest_low).to_numpy()
+    # A flat k-bar range gives 0 rather than inf/NaN
+    raw_k = np.zeros_like(num)
+    np.divide(num, den, out=raw_k, where=den != 0)
+    raw_k *= 100
+    percent_k = pd.Series(raw_k, index=close.index).rolling(window=smooth_k).mean()
     percent_d = percent_k.rolling(window=d).mean()
     return percent_k, percent_d
 
 
-def calculate_adx(high, low, close, period=14):
-    tr_series = (
-        (high - low)
-        .to_frame("tr1")
-        .join((high - close.shift()).abs().to_frame("tr2"))
-        .join((low - close.shift()).abs().to_frame("tr3"))
-        .max(axis=1)
-    )
-    atr = tr_series.ewm(alpha=1 / period, adjust=False).mean()
-    delta_up = high.diff()
-    delta_down = -low.diff()
-    plus_dm = np.where((delta_up > delta_down) & (delta_up > 0), delta_up, 0)
-    minus_dm = np.where((delta_down > delta_up) & (delta_down > 0), delta_down, 0)
-    plus_di = 100 * (
-        pd.Series(plus_dm).ewm(alpha=1 / period, adjust=False).mean() / atr
-    )
-    minus_di = 100 * (
-        pd.Series(minus_dm).ewm(alpha=1 / period, adjust=False).mean() / atr
-    )
-    dx_denominator = plus_di + minus_di
-    dx = 100 * (
-        np.abs(plus_di - minus_di) / dx_denominator.where(dx_denominator != 0, 1)
-    )
-    return dx.ewm(alpha=1 / period, adjust=False).mean()
+def calculate_adx(high, low, close, period=14, cache=None):
+    if talib is not None:
+        adx = talib.ADX(
+            high.to_numpy(dtype=np.float64),
+            low.to_numpy(dtype=np.float64),
+            close.to_numpy(dtype=np.float64),
+            timeperiod=period,
+        )
+        return pd.Series(adx, index=close.index)
+    if cache is None:
+        cache = _indicator_cache(high, low, close)
+    tr, _, high_diff, low_diff = cache
+    atr = _ewm(tr, 1 / period)
+    delta_up = high_diff
+    delta_down = -low_diff
+    plus_dm = np.where((delta_up > delta_down) & (delta_up > 0), delta_up, 0.0)
+    minus_dm = np.where((delta_down > delta_up) & (delta_down > 0), delta_down, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        plus_di = 100 * (_ewm(plus_dm, 1 / period) / atr)
+        minus_di = 100 * (_ewm(minus_dm, 1 / period) / atr)
+    # Handle potential division by zero (both DIs are 0 there, so DX is 0)
+    num = np.abs(plus_di - minus_di)
+    den = plus_di + minus_di
+    dx = np.zeros_like(num)
+    np.divide(num, den, out=dx, where=den != 0)
+    dx *= 100
+    return pd.Series(_ewm(dx, 1 / period), index=close.index)
 
 
 # --- 3. Strategy Mode Enum ---
@@ -105,6 +204,172 @@ class StrategyMode(Enum):
 
 
 # --- 4. MaximizePnLBot Class ---
+INDICATOR_COLS = [
+    "atr",
+    "sma",
+    "rsi",
+    "adx",
+    "macd",
+    "macdsignal",
+    "stoch_k",
+    "stoch_d",
+]
+
+# The exit rule's exp(-max_overshoot) uses a cubic Taylor series below this cutoff,
+# where its x**4 / 24 error stays under 1e-8. Set it to 0 to always use np.exp.
+FAST_EXP_CUTOFF = 0.02
+
+
+@njit(cache=True)
+def _exp_neg(x):
+    """exp(-x), via the cubic Taylor series for 0 <= x < FAST_EXP_CUTOFF."""
+    if 0.0 <= x < FAST_EXP_CUTOFF:
+        return 1.0 - x + 0.5 * x * x - (x * x * x) / 6.0
+    return np.exp(-x)
+
+
+@njit(cache=True)
+def _run_bt(
+    prices,
+    ind,
+    start_idx,
+    dc,
+    vol,
+    yv,
+    vth,
+    rsi_ob,
+    use_vol,
+    use_cls,
+):
+    n = prices.shape[0]
+    entry_idx = np.empty(n, np.int64)
+    exit_idx = np.empty(n, np.int64)
+    entry_px = np.empty(n, np.float64)
+    exit_px = np.empty(n, np.float64)
+    pnl_arr = np.empty(n, np.float64)
+    n_trades = 0
+    total_pnl = 0.0
+
+    current_trend = -1  # -1 = down, 1 = up
+    last_extreme = prices[start_idx, 1]
+    max_overshoot = 0.0001
+    is_position_open = False
+    entry_price = 0.0
+    is_trading_paused = False
+
+    for i in range(start_idx, n):
+        # One bar = one contiguous row: prices are (high, low, close), indicator
+        # fields follow INDICATOR_COLS (atr, sma, rsi, adx, macd, signal, %K, %D)
+        h, l = prices[i, 0], prices[i, 1]
+        row = ind[i]
+
+        # Volatility filter
+        if use_vol:
+            if row[0] > vth:
+                is_trading_paused = True
+                continue
+            else:
+                is_trading_paused = False
+
+        if current_trend == -1:
+            if l < last_extreme:
+                last_extreme = l
+            if h >= last_extreme * (1 + dc):
+                if is_trading_paused:
+                    continue
+                classifier_pass = (
+                    (h > row[1] if not np.isnan(row[1]) else True)
+                    and row[2] < rsi_ob
+                    and row[3] > 10
+                )
+                if use_cls:
+                    classifier_pass = (
+                        h > row[1]
+                        and row[2] < rsi_ob
+                        and row[4] > row[5]
+                        and row[6] > row[7]
+                        and row[3] > 10
+                    )
+                if classifier_pass:
+                    entry_price = h
+                    is_position_open = True
+                    old_extreme = last_extreme
+                    last_extreme = h
+                    max_overshoot = max(max_overshoot, (h - old_extreme) / old_extreme)
+                    current_trend = 1
+                    entry_idx[n_trades] = i
+                    entry_px[n_trades] = h
+                    n_trades += 1
+        else:  # current_trend == 1
+            if h > last_extreme:
+                last_extreme = h
+            if is_position_open:
+                overshoot = (h - entry_price) / entry_price
+                max_overshoot = max(max_overshoot, overshoot)
+                dynamic_exit_threshold = dc * yv * _exp_neg(max_overshoot)
+                if l <= last_extreme * (1 - dynamic_exit_threshold):
+                    pnl = (l - entry_price) * vol
+                    total_pnl += pnl
+                    exit_idx[n_trades - 1] = i
+                    exit_px[n_trades - 1] = l
+                    pnl_arr[n_trades - 1] = pnl
+                    is_position_open = False
+                    current_trend = -1
+                    last_extreme = l
+
+    # Force-close last position
+    if is_position_open:
+        final_price = prices[n - 1, 2]
+        pnl = (final_price - entry_price) * vol
+        total_pnl += pnl
+        exit_idx[n_trades - 1] = n - 1
+        exit_px[n_trades - 1] = final_price
+        pnl_arr[n_trades - 1] = pnl
+
+    return (
+        entry_idx[:n_trades],
+        exit_idx[:n_trades],
+        entry_px[:n_trades],
+        exit_px[:n_trades],
+        pnl_arr[:n_trades],
+        total_pnl,
+    )
+
+
+@njit(cache=True, parallel=True)
+def _sweep(
+    prices,
+    ind,
+    start_idx,
+    dc_arr,
+    vol,
+    yv_arr,
+    vth,
+    rsi_ob,
+    use_vol,
+    use_cls,
+):
+    """Total PnL of _run_bt for every (dc_threshold, y_value) pair."""
+    n_dc, n_yv = dc_arr.shape[0], yv_arr.shape[0]
+    pnl_grid = np.empty((n_dc, n_yv), np.float64)
+    for k in prange(n_dc * n_yv):
+        a, b = k // n_yv, k % n_yv
+        result = _run_bt(
+            prices,
+            ind,
+            start_idx,
+            dc_arr[a],
+            vol,
+            yv_arr[b],
+            vth,
+            rsi_ob,
+            use_vol,
+            use_cls,
+        )
+        pnl_grid[a, b] = result[5]
+    return pnl_grid
+
+
 class MaximizePnLBot:
     def __init__(self, df, params):
         if df.empty:
@@ -113,6 +378,7 @@ class MaximizePnLBot:
         self.params = params
         self.total_pnl = 0.0
         self.trades = []
+        self._log_events = []
 
         self.use_volatility_filter = params["mode"] in [
             StrategyMode.FULL_AI,
@@ -123,94 +389,85 @@ class MaximizePnLBot:
             StrategyMode.NO_VOLATILITY_FILTER,
         ]
 
-        self.current_trend = -1  # -1 = down, 1 = up
-        self.last_extreme = df["low"].iloc[0]
-        self.max_overshoot = 0.0001
-        self.is_position_open = False
-        self.entry_price = 0.0
-        self.is_trading_paused = False
+        # Bars before every indicator has warmed up are skipped, not backfilled
+        first_valid = [df[col].first_valid_index() for col in INDICATOR_COLS]
+        if any(idx is None for idx in first_valid):
+            raise ValueError("Not enough rows to warm up the indicators.")
+        self.start_idx = max(df.index.get_loc(idx) for idx in first_valid)
+
+        # Row-major blocks so the kernel reads each bar from one contiguous row
+        self._prices = np.ascontiguousarray(
+            df[["high", "low", "close"]].to_numpy(dtype=np.float64)
+        )
+        self._ind = np.ascontiguousarray(df[INDICATOR_COLS].to_numpy(dtype=np.float32))
 
     def run_backtest(self):
-        for i, row in self.df.iterrows():
-            high, low, close = row["high"], row["low"], row["close"]
+        entry_idx, exit_idx, entry_px, exit_px, pnl, total_pnl = _run_bt(
+            self._prices,
+            self._ind,
+            self.start_idx,
+            float(self.params["dc_threshold"]),
+            float(self.params["volume"]),
+            float(self.params["y_value"]),
+            float(self.params["volatility_threshold"]),
+            float(self.params["rsi_overbought"]),
+            self.use_volatility_filter,
+            self.use_classifier,
+        )
+
+        self.total_pnl = total_pnl
+        self.trades = []
+        self._log_events = []
+        for e_idx, e_px, x_px, t_pnl, x_idx in zip(
+            entry_idx.tolist(),
+            entry_px.tolist(),
+            exit_px.tolist(),
+            pnl.tolist(),
+            exit_idx.tolist(),
+        ):
+            self._log_events.append((e_idx, "entry", e_px))
+            self.trades.append(
+                {
+                    "entry_price": e_px,
+                    "entry_idx": e_idx,
+                    "exit_price": x_px,
+                    "pnl": t_pnl,
+                    "exit_idx": x_idx,
+                }
+            )
 
-            # Volatility filter
-            if self.use_volatility_filter:
-                if row["atr"] > self.params["volatility_threshold"]:
-                    self.is_trading_paused = True
-                    continue
-                else:
-                    self.is_trading_paused = False
-
-            if self.current_trend == -1:
-                if low < self.last_extreme:
-                    self.last_extreme = low
-                if high >= self.last_extreme * (1 + self.params["dc_threshold"]):
-                    if self.is_trading_paused:
-                        print(
-                            f"Skipped index {i}: ATR {row['atr']:.5f} above threshold"
-                        )
-                        continue
-                    classifier_pass = True
-                    classifier_pass = (
-                        (high > row["sma"] if not np.isnan(row["sma"]) else True)
-                        and row["rsi"] < self.params["rsi_overbought"]
-                        and row["adx"] > 10
-                    )
-                    if self.use_classifier:
-                        classifier_pass = (
-                            high > row["sma"]
-                            and row["rsi"] < self.params["rsi_overbought"]
-                            and row["macd"] > row["macdsignal"]
-                            and row["stoch_k"] > row["stoch_d"]
-                            and row["adx"] > 10
-                        )
-                    if classifier_pass:
-                        print(f"Trade triggered at index {i}, price={high}")
-                        self.entry_price = high
-                        self.is_position_open = True
-                        old_extreme = self.last_extreme
-                        self.last_extreme = high
-                        self.max_overshoot = max(
-                            self.max_overshoot, (high - old_extreme) / old_extreme
-                        )
-                        self.current_trend = 1
-                        self.trades.append(
-                            {"entry_price": self.entry_price, "entry_idx": i}
-                        )
-            else:  # current_trend == 1
-                if high > self.last_extreme:
-                    self.last_extreme = high
-                if self.is_position_open:
-                    overshoot = (high - self.entry_price) / self.entry_price
-                    self.max_overshoot = max(self.max_overshoot, overshoot)
-                    dynamic_exit_threshold = (
-                        self.params["dc_threshold"]
-                        * self.params["y_value"]
-                        * math.exp(-self.max_overshoot)
-                    )
-                    if low <= self.last_extreme * (1 - dynamic_exit_threshold):
-                        exit_price = low
-                        pnl = (exit_price - self.entry_price) * self.params["volume"]
-                        self.total_pnl += pnl
-                        self.trades[-1].update(
-                            {"exit_price": exit_price, "pnl": pnl, "exit_idx": i}
-                        )
-                        self.is_position_open = False
-                        self.current_trend = -1
-                        self.last_extreme = low
-
-        # Force-close last position
-        if self.is_position_open:
-            final_price = self.df["close"].iloc[-1]
-            pnl = (final_price - self.entry_price) * self.params["volume"]
-            self.total_pnl += pnl
-            self.trades[-1].update(
-                {"exit_price": final_price, "pnl": pnl, "exit_idx": len(self.df) - 1}
+        if self.params.get("verbose", False) and self._log_events:
+            print(
+                "\n".join(
+                    f"Trade triggered at index {i}, price={price}"
+                    for i, _, price in self._log_events
+                )
             )
 
         return self.total_pnl, self.trades
 
+    def run_sweep(self, dc_values, y_values):
+        """Total PnL over a dc_threshold x y_value grid, run in parallel."""
+        dc_arr = np.asarray(dc_values, dtype=np.float64)
+        yv_arr = np.asarray(y_values, dtype=np.float64)
+        pnl_grid = _sweep(
+            self._prices,
+            self._ind,
+            self.start_idx,
+            dc_arr,
+            float(self.params["volume"]),
+            yv_arr,
+            float(self.params["volatility_threshold"]),
+            float(self.params["rsi_overbought"]),
+            self.use_volatility_filter,
+            self.use_classifier,
+        )
+        return pd.DataFrame(
+            pnl_grid,
+            index=pd.Index(dc_arr, name="dc_threshold"),
+            columns=pd.Index(yv_arr, name="y_value"),
+        )
+
 
 # --- 5. Parameters ---
 params = {
@@ -223,25 +480,40 @@ params = {
     "sma_period": 50,
     "rsi_period": 14,
     "rsi_overbought": 70,
+    "verbose": False,
+    "run_sweep": False,  # grid-search dc_threshold/y_value after the backtest
 }
 pip_size = 0.0001
 params["volatility_threshold"] = params["volatility_threshold_pips"] * pip_size
 
 # --- 6. Compute Indicators ---
+# TR and bar-to-bar differences are shared by the pandas ATR and ADX
+ind_cache = None
+if talib is None:
+    ind_cache = _indicator_cache(df["high"], df["low"], df["close"])
 df["atr"] = calculate_atr(
-    df["high"], df["low"], df["close"], period=params["atr_period"]
+    df["high"], df["low"], df["close"], period=params["atr_period"], cache=ind_cache
 )
 df["sma"] = df["close"].rolling(window=params["sma_period"]).mean()
 df["rsi"] = calculate_rsi(df["close"], period=params["rsi_period"])
 df["macd"], df["macdsignal"] = calculate_macd(df["close"])
 df["stoch_k"], df["stoch_d"] = calculate_stoch(df["high"], df["low"], df["close"])
-df["adx"] = calculate_adx(df["high"], df["low"], df["close"])
+df["adx"] = calculate_adx(df["high"], df["low"], df["close"], cache=ind_cache)
 
-# Fill initial NaNs instead of dropping all rows
-df.fillna(method="bfill", inplace=True)
-df.reset_index(drop=True, inplace=True)
+# Indicators only feed threshold comparisons, so float32 is plenty and halves
+# what the backtest scan streams; OHLC stays float64 for the PnL arithmetic.
+df[INDICATOR_COLS] = df[INDICATOR_COLS].astype(np.float32)
 
 # --- 7. Run Backtest ---
 bot = MaximizePnLBot(df, params)
 total_pnl, trades = bot.run_backtest()
 print(f"Total PnL: ${total_pnl:.2f}, Total Trades: {len(trades)}")
+
+# --- 8. Parameter Sweep (optional) ---
+if params["run_sweep"]:
+    sweep = bot.run_sweep([0.0005, 0.001, 0.002, 0.005], [0.25, 0.5, 0.75, 1.0])
+    best_dc, best_y = sweep.stack().idxmax()
+    print(
+        f"Best sweep PnL: ${sweep.loc[best_dc, best_y]:.2f} "
+        f"(dc_threshold={best_dc}, y_value={best_y})"
+    )
@@ -1,77 +1,18 @@
 import pandas as pd
 import numpy as np
-import math
 from enum import Enum
 
-# --- 1. Manual Indicator Implementations (No external libraries needed) ---
-
-
-def calculate_atr(high, low, close, period=14):
-    high_low = high - low
-    high_close = np.abs(high - close.shift())
-    low_close = np.abs(low - close.shift())
-    tr = pd.concat([high_low, high_close, low_close], axis=1).max(axis=1)
-    return tr.ewm(alpha=1 / period, adjust=False).mean()
-
-
-def calculate_rsi(close, period=14):
-    delta = close.diff()
-    gain = (delta.where(delta > 0, 0)).ewm(alpha=1 / period, adjust=False).mean()
-    loss = (-delta.where(delta < 0, 0)).ewm(alpha=1 / period, adjust=False).mean()
-    rs = gain / loss
-    return 100 - (100 / (1 + rs))
-
-
-def calculate_macd(close, fast=12, slow=26, signal=9):
-    ema_fast = close.ewm(span=fast, adjust=False).mean()
-    ema_slow = close.ewm(span=slow, adjust=False).mean()
-    macd_line = ema_fast - ema_slow
-    signal_line = macd_line.ewm(span=signal, adjust=False).mean()
-    return macd_line, signal_line
-
-
-def calculate_stoch(high, low, close, k=9, d=3, smooth_k=9):
-    lowest_low = low.rolling(window=k).min()
-    highest_high = high.rolling(window=k).max()
-    percent_k = 100 * ((close - lowest_low) / (highest_high - lowest_low))
-    # Using simple moving average for smoothing
-    percent_k = percent_k.rolling(window=smooth_k).mean()
-    percent_d = percent_k.rolling(window=d).mean()
-    return percent_k, percent_d
-
-
-def calculate_adx(high, low, close, period=14):
-    tr_series = (
-        (high - low)
-        .to_frame("tr1")
-        .join((high - close.shift()).abs().to_frame("tr2"))
-        .join((low - close.shift()).abs().to_frame("tr3"))
-        .max(axis=1)
-    )
-    atr = tr_series.ewm(alpha=1 / period, adjust=False).mean()
-
-    delta_up = high.diff()
-    delta_down = -low.diff()
-
-    plus_dm = np.where((delta_up > delta_down) & (delta_up > 0), delta_up, 0)
-    minus_dm = np.where((delta_down > delta_up) & (delta_down > 0), delta_down, 0)
+try:
+    from numba import njit
+except ImportError:  # without Numba the kernels run as plain Python over the arrays
 
-    plus_di = 100 * (
-        pd.Series(plus_dm).ewm(alpha=1 / period, adjust=False).mean() / atr
-    )
-    minus_di = 100 * (
-        pd.Series(minus_dm).ewm(alpha=1 / period, adjust=False).mean() / atr
-    )
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
 
-    # Handle potential division by zero
-    dx_denominator = plus_di + minus_di
-    dx = 100 * (
-        np.abs(plus_di - minus_di) / dx_denominator.where(dx_denominator != 0, 1)
-    )
-    return dx.ewm(alpha=1 / period, adjust=False).mean()
 
-
-# --- 2. Main Bot and Strategy Classes ---
+# --- 1. Main Bot and Strategy Classes ---
 
 
 class StrategyMode(Enum):
@@ -81,12 +22,307 @@ class StrategyMode(Enum):
     BASELINE = "Baseline"
 
 
+FAST_EXP_CUTOFF = 0.02  # see Maximize_PnL.py; 0 disables the polynomial
+
+
+@njit(cache=True)
+def _exp_neg(x):
+    """exp(-x), via the cubic Taylor series for 0 <= x < FAST_EXP_CUTOFF."""
+    if 0.0 <= x < FAST_EXP_CUTOFF:
+        return 1.0 - x + 0.5 * x * x - (x * x * x) / 6.0
+    return np.exp(-x)
+
+
+@njit(cache=True)
+def _rolling_mean(state, window, val, old):
+    """
+    Push ``val`` into (and drop ``old`` from) a rolling mean, NaN-skipping.
+    Same compensated running sum as pandas ``rolling(window).mean()``, so results
+    match it bit for bit. ``state`` is a length-7 float array:
+    [sum, add compensation, drop compensation, nobs, negatives, run length, last].
+    """
+    if old == old:
+        state[3] -= 1
+        y = -old - state[2]
+        t = state[0] + y
+        state[2] = t - state[0] - y
+        state[0] = t
+        if np.signbit(old):
+            state[4] -= 1
+    if val == val:
+        state[3] += 1
+        y = val - state[1]
+        t = state[0] + y
+        state[1] = t - state[0] - y
+        state[0] = t
+        if np.signbit(val):
+            state[4] += 1
+        state[5] = state[5] + 1 if val == state[6] else 1
+        state[6] = val
+    nobs = state[3]
+    if nobs < window:
+        return np.nan
+    if state[5] >= nobs:
+        return state[6]
+    result = state[0] / nobs
+    if state[4] == 0 and result < 0:
+        return 0.0
+    if state[4] == nobs and result > 0:
+        return 0.0
+    return result
+
+
+@njit(cache=True, error_model="numpy")
+def _run_bt(
+    high,
+    low,
+    close,
+    atr_period,
+    sma_period,
+    rsi_period,
+    macd_fast,
+    macd_slow,
+    macd_signal,
+    stoch_k,
+    stoch_d,
+    stoch_smooth_k,
+    adx_period,
+    dc,
+    vol,
+    yv,
+    vth,
+    rsi_ob,
+    use_vol,
+    use_cls,
+):
+    n = high.shape[0]
+    entry_idx = np.empty(n, np.int64)
+    exit_idx = np.empty(n, np.int64)
+    entry_px = np.empty(n, np.float64)
+    exit_px = np.empty(n, np.float64)
+    pnl_arr = np.empty(n, np.float64)
+    n_trades = 0
+    total_pnl = 0.0
+
+    # Indicator state, updated in O(1) per bar (EWMAs seeded on the first bar)
+    a_atr = 1.0 / atr_period
+    a_rsi = 1.0 / rsi_period
+    a_fast = 2.0 / (macd_fast + 1)
+    a_slow = 2.0 / (macd_slow + 1)
+    a_sig = 2.0 / (macd_signal + 1)
+    a_adx = 1.0 / adx_period
+    atr = 0.0
+    avg_gain = 0.0
+    avg_loss = 0.0
+    ema_fast = 0.0
+    ema_slow = 0.0
+    macd_sig = 0.0
+    atr_adx = 0.0
+    plus_dm_s = 0.0
+    minus_dm_s = 0.0
+    adx_s = 0.0
+    sma_state = np.zeros(7)
+    raw_k_state = np.zeros(7)
+    k_state = np.zeros(7)
+    raw_k_buf = np.full(stoch_smooth_k, np.nan)
+    k_buf = np.full(stoch_d, np.nan)
+
+    current_trend = -1
+    last_extreme_price = 0.0
+    max_overshoot = 0.0001
+    is_position_open = False
+    entry_price = 0.0
+    is_trading_paused = False
+    first_bar = -1
+    last_bar = n - 1
+
+    for i in range(n):
+        h, l, c = high[i], low[i], close[i]
+
+        # --- Indicators ---
+        if i == 0:
+            tr = h - l
+            gain = 0.0
+            loss = 0.0
+            plus_dm = 0.0
+            minus_dm = 0.0
+        else:
+            pc = close[i - 1]
+            tr = max(h - l, abs(h - pc), abs(l - pc))
+            delta = c - pc
+            gain = delta if delta > 0 else 0.0
+            loss = -delta if delta < 0 else 0.0
+            delta_up = h - high[i - 1]
+            delta_down = low[i - 1] - l
+            plus_dm = delta_up if delta_up > delta_down and delta_up > 0 else 0.0
+            minus_dm = delta_down if delta_down > delta_up and delta_down > 0 else 0.0
+
+        if i == 0:
+            atr = tr
+            avg_gain = gain
+            avg_loss = loss
+            ema_fast = c
+            ema_slow = c
+            atr_adx = tr
+            plus_dm_s = plus_dm
+            minus_dm_s = minus_dm
+        else:
+            atr = (1 - a_atr) * atr + a_atr * tr
+            avg_gain = (1 - a_rsi) * avg_gain + a_rsi * gain
+            avg_loss = (1 - a_rsi) * avg_loss + a_rsi * loss
+            ema_fast = (1 - a_fast) * ema_fast + a_fast * c
+            ema_slow = (1 - a_slow) * ema_slow + a_slow * c
+            atr_adx = (1 - a_adx) * atr_adx + a_adx * tr
+            plus_dm_s = (1 - a_adx) * plus_dm_s + a_adx * plus_dm
+            minus_dm_s = (1 - a_adx) * minus_dm_s + a_adx * minus_dm
+
+        old = close[i - sma_period] if i >= sma_period else np.nan
+        sma = _rolling_mean(sma_state, sma_period, c, old)
+
+        if avg_loss != 0:
+            rsi = 100 - (100 / (1 + avg_gain / avg_loss))
+        else:
+            rsi = 100.0 if avg_gain > 0 else np.nan
+
+        macd = ema_fast - ema_slow
+        if i == 0:
+            macd_sig = macd
+        else:
+            macd_sig = (1 - a_sig) * macd_sig + a_sig * macd
+
+        raw_k = np.nan
+        if i >= stoch_k - 1:
+            lowest_low = low[i]
+            highest_high = high[i]
+            for j in range(i - stoch_k + 1, i):
+                lowest_low = min(lowest_low, low[j])
+                highest_high = max(highest_high, high[j])
+            raw_k = 100 * ((c - lowest_low) / (highest_high - lowest_low))
+        slot = i % stoch_smooth_k
+        sk = _rolling_mean(raw_k_state, stoch_smooth_k, raw_k, raw_k_buf[slot])
+        raw_k_buf[slot] = raw_k
+        slot = i % stoch_d
+        sd = _rolling_mean(k_state, stoch_d, sk, k_buf[slot])
+        k_buf[slot] = sk
+
+        plus_di = 100 * (plus_dm_s / atr_adx)
+        minus_di = 100 * (minus_dm_s / atr_adx)
+        dx_denominator = plus_di + minus_di
+        dx = 100 * (
+            abs(plus_di - minus_di) / (dx_denominator if dx_denominator != 0 else 1)
+        )
+        if i == 0:
+            adx_s = dx
+        elif not np.isnan(dx):
+            adx_s = dx if np.isnan(adx_s) else (1 - a_adx) * adx_s + a_adx * dx
+        adx = adx_s
+
+        # Bars without a full set of indicators are skipped (warm-up)
+        if (
+            np.isnan(sma)
+            or np.isnan(atr)
+            or np.isnan(rsi)
+            or np.isnan(macd_sig)
+            or np.isnan(sk)
+            or np.isnan(sd)
+            or np.isnan(adx)
+        ):
+            continue
+        if first_bar < 0:
+            last_extreme_price = l
+            first_bar = i
+        last_bar = i
+
+        # --- Strategy ---
+        if use_vol:
+            is_high_volatility = atr > vth
+            if is_high_volatility and not is_trading_paused:
+                is_trading_paused = True
+            elif not is_high_volatility and is_trading_paused:
+                is_trading_paused = False
+
+        if current_trend == -1:
+            if l < last_extreme_price:
+                last_extreme_price = l
+            if h >= last_extreme_price * (1 + dc):
+                if is_trading_paused:
+                    continue
+                classifier_pass = True
+                if use_cls:
+                    is_sma_confirm = h > sma
+                    is_rsi_confirm = rsi < rsi_ob
+                    is_macd_confirm = macd > macd_sig
+                    is_stoch_confirm = sk > sd
+                    is_trending_market = adx > 25
+                    classifier_pass = (
+                        is_sma_confirm
+                        and is_rsi_confirm
+                        and is_macd_confirm
+                        and is_stoch_confirm
+                        and is_trending_market
+                    )
+
+                if classifier_pass:
+                    entry_price = h
+                    is_position_open = True
+                    current_trend = 1
+                    old_extreme = last_extreme_price
+                    last_extreme_price = h
+                    max_overshoot = max(
+                        max_overshoot,
+                        (h - old_extreme) / old_extreme if old_extreme != 0 else 0.0,
+                    )
+                    entry_idx[n_trades] = i
+                    entry_px[n_trades] = entry_price
+                    pnl_arr[n_trades] = 0.0
+                    n_trades += 1
+
+        elif current_trend == 1:
+            if h > last_extreme_price:
+                last_extreme_price = h
+            if is_position_open:
+                overshoot = (h - entry_price) / entry_price if entry_price != 0 else 0.0
+                max_overshoot = max(max_overshoot, overshoot)
+                dynamic_exit_threshold = dc * yv * _exp_neg(max_overshoot)
+
+                if l <= last_extreme_price * (1 - dynamic_exit_threshold):
+                    pnl = (l - entry_price) * vol
+                    total_pnl += pnl
+                    exit_idx[n_trades - 1] = i
+                    exit_px[n_trades - 1] = l
+                    pnl_arr[n_trades - 1] = pnl
+                    is_position_open = False
+                    current_trend = -1
+                    last_extreme_price = l
+
+    if is_position_open:
+        pnl = (close[last_bar] - entry_price) * vol
+        total_pnl += pnl
+        exit_idx[n_trades - 1] = last_bar
+        exit_px[n_trades - 1] = close[last_bar]
+        pnl_arr[n_trades - 1] = pnl
+
+    return (
+        entry_idx[:n_trades],
+        exit_idx[:n_trades],
+        entry_px[:n_trades],
+        exit_px[:n_trades],
+        pnl_arr[:n_trades],
+        total_pnl,
+        is_position_open,
+        first_bar,
+        last_bar,
+    )
+
+
 class AdvancedDCBot:
     def __init__(self, data, params):
         self.df = data
         self.params = params
         self.trades = []
         self.total_pnl = 0.0
+        self._log_events = []
+        self.first_bar, self.last_bar = 0, len(data) - 1
         self.use_volatility_filter = params["mode"] in [
             StrategyMode.FULL_AI,
             StrategyMode.NO_CLASSIFIER,
@@ -106,128 +342,105 @@ class AdvancedDCBot:
             )
             return 0.0, []
 
-        current_trend = -1
-        last_extreme_price = self.df["low"].iloc[0]
-        max_overshoot = 0.0001
-        is_position_open = False
-        entry_price = 0.0
-        is_trading_paused = False
-        trade = {}
-
-        for i, row in self.df.iterrows():
-            date, high, low = row["date"], row["high"], row["low"]
-
-            if pd.isna(row["sma"]):
-                continue
-
-            if self.use_volatility_filter:
-                is_high_volatility = row["atr"] > self.params["volatility_threshold"]
-                if is_high_volatility and not is_trading_paused:
-                    is_trading_paused = True
-                elif not is_high_volatility and is_trading_paused:
-                    is_trading_paused = False
-
-            if current_trend == -1:
-                if low < last_extreme_price:
-                    last_extreme_price = low
-                if high >= last_extreme_price * (1 + self.params["dc_threshold"]):
-                    if is_trading_paused:
-                        continue
-                    classifier_pass = True
-                    if self.use_classifier:
-                        is_sma_confirm = high > row["sma"]
-                        is_rsi_confirm = row["rsi"] < self.params["rsi_overbought"]
-                        is_macd_confirm = row["macd"] > row["macdsignal"]
-                        is_stoch_confirm = row["stoch_k"] > row["stoch_d"]
-                        is_trending_market = row["adx"] > 25
-                        classifier_pass = all(
-                            [
-                                is_sma_confirm,
-                                is_rsi_confirm,
-                                is_macd_confirm,
-                                is_stoch_confirm,
-                                is_trending_market,
-                            ]
-                        )
-
-                    if classifier_pass:
-                        entry_price = high
-                        is_position_open = True
-                        current_trend = 1
-                        old_extreme = last_extreme_price
-                        last_extreme_price = high
-                        max_overshoot = max(
-                            max_overshoot,
-                            (
-                                (high - old_extreme) / old_extreme
-                                if old_extreme != 0
-                                else 0
-                            ),
-                        )
-                        trade = {
-                            "entry_date": date,
-                            "entry_price": entry_price,
-                            "pnl": 0,
-                        }
-                        print(
-                            f"{date.strftime('%Y-%m-%d')}: Opened LONG position at {entry_price:.4f}"
-                        )
-
-            elif current_trend == 1:
-                if high > last_extreme_price:
-                    last_extreme_price = high
-                if is_position_open:
-                    overshoot = (
-                        (high - entry_price) / entry_price if entry_price != 0 else 0
-                    )
-                    max_overshoot = max(max_overshoot, overshoot)
-                    dynamic_exit_threshold = (
-                        self.params["dc_threshold"]
-                        * self.params["y_value"]
-                        * math.exp(-max_overshoot)
-                    )
-
-                    if low <= last_extreme_price * (1 - dynamic_exit_threshold):
-                        exit_price = low
-                        pnl = (exit_price - entry_price) * self.params["volume"]
-                        self.total_pnl += pnl
-                        trade.update(
-                            {"exit_date": date, "exit_price": exit_price, "pnl": pnl}
-                        )
-                        self.trades.append(trade)
-                        is_position_open = False
-                        current_trend = -1
-                        last_extreme_price = low
-                        print(
-                            f"{date.strftime('%Y-%m-%d')}: Closed LONG position at {exit_price:.4f} | PnL: ${pnl:.2f}"
-                        )
-
-        if is_position_open:
-            final_price = self.df["close"].iloc[-1]
-            pnl = (final_price - entry_price) * self.params["volume"]
-            self.total_pnl += pnl
-            trade.update(
+        df = self.df
+        (
+            entry_idx,
+            exit_idx,
+            entry_px,
+            exit_px,
+            pnl,
+            total_pnl,
+            force_closed,
+            first_bar,
+            last_bar,
+        ) = _run_bt(
+            df["high"].to_numpy(dtype=np.float64),
+            df["low"].to_numpy(dtype=np.float64),
+            df["close"].to_numpy(dtype=np.float64),
+            int(self.params["atr_period"]),
+            int(self.params["sma_period"]),
+            int(self.params["rsi_period"]),
+            12,  # MACD fast
+            26,  # MACD slow
+            9,  # MACD signal
+            9,  # %K lookback
+            3,  # %D smoothing
+            9,  # %K smoothing
+            14,  # ADX period
+            float(self.params["dc_threshold"]),
+            float(self.params["volume"]),
+            float(self.params["y_value"]),
+            float(self.params["volatility_threshold"]),
+            float(self.params["rsi_overbought"]),
+            self.use_volatility_filter,
+            self.use_classifier,
+        )
+        if first_bar < 0:
+            raise ValueError("Not enough rows to warm up the indicators.")
+        # First and last bars the strategy actually ran on (after warm-up)
+        self.first_bar, self.last_bar = first_bar, last_bar
+
+        self.total_pnl += total_pnl
+        self._log_events = []
+        dates = df["date"]
+        n_trades = len(entry_idx)
+        for k, (e_idx, e_px, x_px, t_pnl, x_idx) in enumerate(
+            zip(
+                entry_idx.tolist(),
+                entry_px.tolist(),
+                exit_px.tolist(),
+                pnl.tolist(),
+                exit_idx.tolist(),
+            )
+        ):
+            entry_date = dates.iloc[e_idx]
+            exit_date = dates.iloc[x_idx]
+            self._log_events.append((e_idx, "open", e_px, 0.0))
+            if not (force_closed and k == n_trades - 1):
+                self._log_events.append((x_idx, "close", x_px, t_pnl))
+            self.trades.append(
                 {
-                    "exit_date": self.df["date"].iloc[-1],
-                    "exit_price": final_price,
-                    "pnl": pnl,
+                    "entry_date": entry_date,
+                    "entry_price": e_px,
+                    "pnl": t_pnl,
+                    "exit_date": exit_date,
+                    "exit_price": x_px,
                 }
             )
-            self.trades.append(trade)
-            print(f"Force closing open position at end of backtest. PnL: ${pnl:.2f}")
+
+        if self.params.get("verbose", False) and self._log_events:
+            print("\n".join(self._format_event(*event) for event in self._log_events))
+        if force_closed:
+            print(
+                f"Force closing open position at end of backtest. PnL: ${pnl[-1]:.2f}"
+            )
 
         return self.total_pnl, self.trades
 
+    def _format_event(self, i, kind, price, pnl):
+        date = self.df["date"].iloc[i].strftime("%Y-%m-%d")
+        if kind == "open":
+            return f"{date}: Opened LONG position at {price:.4f}"
+        return f"{date}: Closed LONG position at {price:.4f} | PnL: ${pnl:.2f}"
+
 
 # --- Main Execution Block ---
 try:
     # 3. Load and Prepare the 'EURUSD Data.csv' file
-    df = pd.read_csv("EUR_USD.csv")
+    price_cols = ["Price", "Open", "High", "Low"]
+    df = pd.read_csv(
+        "EUR_USD.csv",
+        usecols=["Date", *price_cols],
+        dtype=dict.fromkeys(price_cols, np.float64),
+        parse_dates=["Date"],
+        dayfirst=True,
+        engine="c",
+    )
     initial_rows = len(df)
 
     df.columns = [col.lower() for col in df.columns]
+    df.rename(columns={"price": "close"}, inplace=True)
 
-    df["date"] = pd.to_datetime(df["date"], format="%m/%d/%Y")
     df.sort_values(by="date", inplace=True)
     df.reset_index(drop=True, inplace=True)
 
@@ -247,6 +460,7 @@ try:
         "sma_period": 50,
         "rsi_period": 14,
         "rsi_overbought": 70,
+        "verbose": False,
     }
 
     required_data_length = strategy_params["sma_period"]
@@ -255,36 +469,23 @@ try:
             f"Data is too short. Need at least {required_data_length} valid rows, but found only {len(df)}."
         )
 
-    print("Calculating technical indicators...")
     pip_size = 0.0001
-    df["atr"] = calculate_atr(
-        df["high"], df["low"], df["close"], period=strategy_params["atr_period"]
-    )
     strategy_params["volatility_threshold"] = (
         strategy_params["volatility_threshold_pips"] * pip_size
     )
-    df["sma"] = df["close"].rolling(window=strategy_params["sma_period"]).mean()
-    df["rsi"] = calculate_rsi(df["close"], period=strategy_params["rsi_period"])
-    df["macd"], df["macdsignal"] = calculate_macd(df["close"])
-    df["stoch_k"], df["stoch_d"] = calculate_stoch(df["high"], df["low"], df["close"])
-    df["adx"] = calculate_adx(df["high"], df["low"], df["close"])
-
-    df.dropna(inplace=True)
-    df.reset_index(drop=True, inplace=True)
-
-    print(
-        f"Data ready for backtest: {len(df)} rows remaining after indicator calculation."
-    )
 
-    # 5. Run the Backtest
+    # 5. Run the Backtest (indicators are computed inside the kernel)
     bot = AdvancedDCBot(df, strategy_params)
     total_pnl, trades = bot.run_backtest()
+    print(
+        f"Data ready for backtest: {bot.last_bar - bot.first_bar + 1} rows remaining after indicator calculation."
+    )
 
     if not df.empty and trades is not None:
         print("\n--- Backtest Summary ---")
         print(f"Strategy Mode: {strategy_params['mode'].value}")
         print(
-            f"Time Period: {df['date'].iloc[0].strftime('%Y-%m-%d')} to {df['date'].iloc[-1].strftime('%Y-%m-%d')}"
+            f"Time Period: {df['date'].iloc[bot.first_bar].strftime('%Y-%m-%d')} to {df['date'].iloc[bot.last_bar].strftime('%Y-%m-%d')}"
         )
         print(f"Total Trades: {len(trades)}")
         print(f"Total PnL: ${total_pnl:.2f}")
@@ -12,11 +12,12 @@ Note   : Replace synthetic_tick_stream() with real L1 quotes for live/paper trad
 
 # -------------------- IMPORTS --------------------
 import time
+import inspect
 import itertools
 import numpy as np
 import pandas as pd
-from collections import defaultdict
-from sklearn.ensemble import RandomForestClassifier
+from joblib import Memory, hash as joblib_hash
+from sklearn.ensemble import HistGradientBoostingClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report
 
@@ -24,6 +25,7 @@ from sklearn.metrics import classification_report
 # 1. SAMPLE TICK STREAM  (offline demo)
 # --------------------------------------------------
 CURRENCIES = ["USD", "EUR", "JPY", "GBP", "AUD", "CAD", "CHF", "NZD", "CNY", "SEK"]
+CUR_IDX = {c: i for i, c in enumerate(CURRENCIES)}
 
 
 def synthetic_tick_stream(n_ticks=5000, seed=42):
@@ -49,39 +51,75 @@ class FXGraph:
     """Maintain directed edges base->quote with best bid/ask."""
 
     def __init__(self):
-        self.bid = defaultdict(lambda: defaultdict(float))
-        self.ask = defaultdict(lambda: defaultdict(float))
+        n = len(CURRENCIES)
+        # NaN marks an edge that has not been quoted yet
+        self.bid_m = np.full((n, n), np.nan, dtype=np.float64)
+        self.ask_m = np.full((n, n), np.nan, dtype=np.float64)
+        self.mid = np.full((n, n), np.nan, dtype=np.float64)
 
     def update(self, base, quote, bid, ask):
-        self.bid[base][quote] = bid
-        self.ask[base][quote] = ask
+        i, j = CUR_IDX[base], CUR_IDX[quote]
+        self.bid_m[i, j] = bid
+        self.ask_m[i, j] = ask
+        self.mid[i, j] = 0.5 * (bid + ask)
 
     def get_cross_rate(self, a, b):
         """Return mid-price if direct edge exists else np.nan."""
-        if b in self.bid[a]:
-            return 0.5 * (self.bid[a][b] + self.ask[a][b])
-        return np.nan
+        i, j = CUR_IDX[a], CUR_IDX[b]
+        return 0.5 * (self.bid_m[i, j] + self.ask_m[i, j])
 
 
 # --------------------------------------------------
 # 3. TRIANGULAR ARB DETECTION
 # --------------------------------------------------
-def find_cycles(graph, threshold=1e-5):
+# Index triples (a, b, c) with a < b < c by name: one orientation per cycle
+_I, _J, _K = np.array(
+    [
+        (CUR_IDX[a], CUR_IDX[b], CUR_IDX[c])
+        for a, b, c in itertools.permutations(CURRENCIES, 3)
+        if a < b < c
+    ]
+).T
+
+
+def _edge_to_triples():
+    """Map each directed edge (i, j) to the rows of _I/_J/_K whose cycle uses it."""
+    rows = {
+        (i, j): [] for i, j in itertools.permutations(range(len(CURRENCIES)), 2)
+    }
+    for s, (a, b, c) in enumerate(zip(_I.tolist(), _J.tolist(), _K.tolist())):
+        for edge in ((a, b), (b, c), (c, a)):
+            rows[edge].append(s)
+    return {edge: np.array(r, dtype=np.int32) for edge, r in rows.items()}
+
+
+EDGE2TRIPLES = _edge_to_triples()
+
+
+def find_cycles(graph, threshold=1e-5, edge=None):
     """
     Find simple 3-currency cycles a->b->c->a
+    If edge=(base, quote) is given, only cycles through that edge are rechecked
+    (the only ones whose PnL an update of it can change).
     Return list of (cycle, theoretical_pnl)
     """
-    cycles = []
-    for a, b, c in itertools.permutations(CURRENCIES, 3):
-        if a < b < c:  # avoid duplicate permutations
-            r1 = graph.get_cross_rate(a, b)
-            r2 = graph.get_cross_rate(b, c)
-            r3 = graph.get_cross_rate(c, a)
-            if not (np.isnan(r1) or np.isnan(r2) or np.isnan(r3)):
-                pnl = (r1 * r2 * r3) - 1.0
-                if abs(pnl) > threshold:
-                    cycles.append(((a, b, c), pnl))
-    return cycles
+    if edge is None:
+        I, J, K = _I, _J, _K
+    else:
+        rows = EDGE2TRIPLES[CUR_IDX[edge[0]], CUR_IDX[edge[1]]]
+        I, J, K = _I[rows], _J[rows], _K[rows]
+    M = graph.mid
+    pnl = M[I, J] * M[J, K] * M[K, I] - 1.0
+    valid = (np.abs(pnl) > threshold) & ~np.isnan(pnl)
+    return [
+        ((CURRENCIES[a], CURRENCIES[b], CURRENCIES[c]), p)
+        for a, b, c, p in zip(
+            I[valid].tolist(),
+            J[valid].tolist(),
+            K[valid].tolist(),
+            pnl[valid].tolist(),
+        )
+    ]
 
 
 # --------------------------------------------------
@@ -104,26 +142,33 @@ def train_ai_filter(X, y):
     X_train, X_val, y_train, y_val = train_test_split(
         X, y, test_size=0.2, random_state=42, stratify=y
     )
-    clf = RandomForestClassifier(
-        n_estimators=100, random_state=42, class_weight="balanced"
+    clf = HistGradientBoostingClassifier(
+        max_iter=100, random_state=42, class_weight="balanced"
     )
     clf.fit(X_train, y_train)
     print("\nValidation report:\n", classification_report(y_val, clf.predict(X_val)))
     return clf
 
 
-# --------------------------------------------------
-# 6. MAIN LOOP  (stream + detect + filter)
-# --------------------------------------------------
-def main():
+memory = Memory(".cache", verbose=0)
+
+
+@memory.cache
+def _train(seed, n_ticks, pipeline_key):
+    """
+    Replay n_ticks synthetic quotes, label every cycle a quote changes and fit
+    the filter. Cached on disk by (seed, n_ticks, pipeline_key); returns
+    (clf, graph) so the live loop starts from the same quote graph as an
+    uncached run.
+    """
     graph = FXGraph()
     X_feat, y_label = [], []
 
     print("Collecting synthetic cycles for training …")
-    for tick in synthetic_tick_stream(3000):
+    for tick in synthetic_tick_stream(n_ticks, seed=seed):
         _, base, quote, bid, ask = tick
         graph.update(base, quote, bid, ask)
-        for cyc, pnl in find_cycles(graph):
+        for cyc, pnl in find_cycles(graph, edge=(base, quote)):
             X_feat.append(cycle_to_features(cyc, pnl))
             y_label.append(1 if pnl > 0 else 0)
 
@@ -131,7 +176,30 @@ def main():
     y = np.array(y_label)
     print(f"Collected {len(y)} candidate cycles")
 
-    clf = train_ai_filter(X, y)
+    return train_ai_filter(X, y), graph
+
+
+def _pipeline_key():
+    """
+    Hash of the code _train depends on. joblib keys the cache on _train's own
+    source only, so edits to these would otherwise load a stale model.
+    """
+    deps = (
+        synthetic_tick_stream,
+        FXGraph,
+        _edge_to_triples,
+        find_cycles,
+        cycle_to_features,
+        train_ai_filter,
+    )
+    return joblib_hash([CURRENCIES, *(inspect.getsource(obj) for obj in deps)])
+
+
+# --------------------------------------------------
+# 6. MAIN LOOP  (stream + detect + filter)
+# --------------------------------------------------
+def main():
+    clf, graph = _train(42, 3000, _pipeline_key())
 
     # --- Live/Replay loop with profiling ---
     start = time.perf_counter()
@@ -139,11 +207,15 @@ def main():
     for tick in synthetic_tick_stream(1000, seed=99):
         _, base, quote, bid, ask = tick
         graph.update(base, quote, bid, ask)
-        for cyc, pnl in find_cycles(graph):
-            detections += 1
-            feat = np.array(cycle_to_features(cyc, pnl)).reshape(1, -1)
-            if clf.predict(feat)[0] == 1:
-                executed += 1
+        feats = [
+            cycle_to_features(cyc, pnl)
+            for cyc, pnl in find_cycles(graph, edge=(base, quote))
+        ]
+        if not feats:
+            continue
+        preds = clf.predict(np.asarray(feats, dtype=np.float64))
+        detections += len(feats)
+        executed += int(preds.sum())
     elapsed = time.perf_counter() - start
     print(f"\nScanned {detections} cycles, executed {executed}")
     print(f"Elapsed time for live loop: {elapsed:.3f} sec")